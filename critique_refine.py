@@ -4,14 +4,24 @@
 # One agent creates, another critiques, and they iterate until quality
 # is acceptable. This mimics how professional editing actually works.
 
-from typing import TypedDict, Literal
+from typing import TypedDict, Annotated, Literal
 from langgraph.graph import StateGraph, START, END
-from langchain_openai import ChatOpenAI
-from dotenv import load_dotenv
-
-load_dotenv()
-
-llm = ChatOpenAI(model="gpt-4o-mini", temperature=0.7)
+from langchain_core.messages import AIMessage, BaseMessage
+from langchain_core.prompts import ChatPromptTemplate
+from langchain_community.cache import SQLiteCache
+from pydantic import BaseModel, Field
+from llm_client import llm, ainvoke_limited, warmup, BATCH_CONCURRENCY
+import argparse
+import asyncio
+import openai
+import operator
+
+# Cache completions on disk, keyed by prompt and model parameters.
+# Re-running the loop with the same task skips the LLM for every prompt
+# it has already seen. Each revision's prompt carries the whole thread so
+# far, so every revision gets its own cache entry. The cache is attached to
+# this pattern's models only, so the shared `llm` stays uncached elsewhere.
+_cache = SQLiteCache(database_path=".llm_cache.db")
 
 
 # =============================================================================
@@ -19,20 +29,48 @@ llm = ChatOpenAI(model="gpt-4o-mini", temperature=0.7)
 # =============================================================================
 
 class CritiqueState(TypedDict):
-    task: str               # The task to accomplish
-    current_work: str       # Current version of the work
-    critique: str           # Feedback from the critic
-    revision_count: int     # Number of revisions made
-    max_revisions: int      # Maximum allowed revisions
-    is_approved: bool       # Whether the critic approved
-    final_work: str         # Final approved version
+    task: str                                                   # The task to accomplish
+    current_work: str                                           # Current version of the work
+    critique: str                                               # Feedback from the critic
+    revision_count: int                                         # Number of revisions made
+    max_revisions: int                                          # Maximum allowed revisions
+    is_approved: bool                                           # Whether the critic approved
+    final_work: str                                             # Final approved version
+    creator_history: Annotated[list[BaseMessage], operator.add] # Creator's chat thread
+    critic_history: Annotated[list[BaseMessage], operator.add]  # Critic's chat thread
 
 
 # =============================================================================
 # CREATOR
+# The creator and critic each keep a chat thread. After the first turn only
+# the newest message is appended, so the earlier turns form a stable prefix
+# the provider's prompt cache can reuse instead of re-prefilling the work.
+# Replies go into the threads as plain content: the response objects carry
+# metadata that differs between a fresh call and a cache hit, which would
+# change the next prompt's cache key on a re-run.
 # =============================================================================
 
-def creator(state: CritiqueState) -> dict:
+creator_llm = llm.model_copy(update={"cache": _cache})
+
+CREATOR_INITIAL = ChatPromptTemplate.from_messages([
+    ("system", "You produce work for a task and revise it when a critic gives you feedback."),
+    ("human", """Create a response for this task:
+
+TASK: {task}
+
+Do your best work. Be thorough but concise.""")
+])
+
+CREATOR_REVISE = ChatPromptTemplate.from_template("""Revise your work based on this critique:
+
+CRITIC'S FEEDBACK:
+{critique}
+
+Address the specific concerns raised while keeping what works well.
+Don't over-correct - fix the issues mentioned, not everything.""")
+
+
+async def creator(state: CritiqueState) -> dict:
     """
     Creates initial work or revises based on feedback.
     
@@ -40,39 +78,27 @@ def creator(state: CritiqueState) -> dict:
     It just needs to get something on the page that the critic
     can work with.
     """
-    revision_count = state.get("revision_count", 0)
+    revision_count = state["revision_count"]
+    history = state["creator_history"]
     
     if revision_count == 0:
         # Initial creation
-        prompt = f"""Create a response for this task:
-
-TASK: {state['task']}
-
-Do your best work. Be thorough but concise."""
+        new_messages = CREATOR_INITIAL.format_messages(task=state["task"])
         
         print("[Creator] Generating initial draft...")
     else:
-        # Revision based on feedback
-        prompt = f"""Revise your work based on this critique:
-
-TASK: {state['task']}
-
-YOUR PREVIOUS WORK:
-{state['current_work']}
-
-CRITIC'S FEEDBACK:
-{state['critique']}
-
-Address the specific concerns raised while keeping what works well.
-Don't over-correct - fix the issues mentioned, not everything."""
+        # Revision based on feedback - the task and previous work are
+        # already in the thread
+        new_messages = CREATOR_REVISE.format_messages(critique=state["critique"])
         
         print(f"[Creator] Revision {revision_count} based on feedback...")
     
-    response = llm.invoke(prompt)
+    response = await ainvoke_limited(history + new_messages, creator_llm)
     
     return {
         "current_work": response.content,
-        "revision_count": revision_count + 1
+        "revision_count": revision_count + 1,
+        "creator_history": new_messages + [AIMessage(content=response.content)]
     }
 
 
@@ -80,19 +106,22 @@ Don't over-correct - fix the issues mentioned, not everything."""
 # CRITIC
 # =============================================================================
 
-def critic(state: CritiqueState) -> dict:
-    """
-    Evaluates work and provides specific, actionable feedback.
-    
-    The critic is harder to satisfy than the creator is to produce.
-    This asymmetry is the engine of improvement.
-    """
-    prompt = f"""Critically evaluate this work:
+class Verdict(BaseModel):
+    """The critic's decision and feedback."""
+    approved: bool = Field(description="Whether the work meets the quality bar")
+    feedback: str = Field(description="Specific, actionable feedback on what to change, in one short paragraph")
 
-TASK: {state['task']}
 
-WORK TO EVALUATE:
-{state['current_work']}
+# The critic runs deterministically so identical work gets an identical
+# (cacheable) verdict, and its output is capped since a verdict only needs
+# a paragraph. The decision comes back as a structured field instead of
+# being parsed out of prose; the raw reply is kept for the chat thread.
+critic_llm = llm.model_copy(update={"temperature": 0, "max_tokens": 400, "cache": _cache}).with_structured_output(Verdict, include_raw=True)
+
+CRITIC_INITIAL = ChatPromptTemplate.from_messages([
+    ("system", """Critically evaluate work for this task:
+
+TASK: {task}
 
 Evaluate on:
 1. Completeness - Does it fully address the task?
@@ -100,28 +129,61 @@ Evaluate on:
 3. Clarity - Is it easy to understand?
 4. Quality - Is it well-written/well-structured?
 
-If the work meets a high quality bar (8/10 or better), respond with:
-APPROVED
-
-If the work needs improvement, respond with:
-REVISE: [specific, actionable feedback]
+Approve the work only if it meets a high quality bar (8/10 or better).
+Otherwise, give specific, actionable feedback.
 
 Be specific. Don't say "make it better" - say exactly what needs to change and why.
-But also be reasonable - don't demand perfection."""
+But also be reasonable - don't demand perfection."""),
+    ("human", """WORK TO EVALUATE:
+{current_work}""")
+])
+
+CRITIC_FOLLOWUP = ChatPromptTemplate.from_template("""The work has been revised. Evaluate the new version against the same criteria:
+
+WORK TO EVALUATE:
+{current_work}""")
+
+
+async def critic(state: CritiqueState) -> dict:
+    """
+    Evaluates work and provides specific, actionable feedback.
     
-    response = llm.invoke(prompt)
-    content = response.content
+    The critic is harder to satisfy than the creator is to produce.
+    This asymmetry is the engine of improvement.
+    """
+    history = state["critic_history"]
+    
+    if not history:
+        new_messages = CRITIC_INITIAL.format_messages(task=state["task"], current_work=state["current_work"])
+    else:
+        new_messages = CRITIC_FOLLOWUP.format_messages(current_work=state["current_work"])
     
-    is_approved = "APPROVED" in content.upper() and "REVISE" not in content.upper()
+    try:
+        result = await ainvoke_limited(history + new_messages, critic_llm)
+        verdict = None if result["parsing_error"] else result["parsed"]
+        reply = AIMessage(content=result["raw"].content)
+    except openai.LengthFinishReasonError:
+        # Reply was cut off by the token cap
+        verdict = None
     
-    if is_approved:
+    if verdict is None:
+        # Truncated, refused or unparseable - treat it as not approved. The
+        # failure is the critic's, so the feedback doesn't ask for changes.
+        verdict = Verdict(
+            approved=False,
+            feedback="No review is available for this version. Keep the work as it is unless you spot a clear problem."
+        )
+        reply = AIMessage(content=verdict.model_dump_json())
+    
+    if verdict.approved:
         print("[Critic] APPROVED")
     else:
         print(f"[Critic] Revision requested")
     
     return {
-        "critique": content,
-        "is_approved": is_approved
+        "critique": verdict.feedback,
+        "is_approved": verdict.approved,
+        "critic_history": new_messages + [reply]
     }
 
 
@@ -146,11 +208,11 @@ def should_continue(state: CritiqueState) -> Literal["revise", "finalize"]:
     - Work is approved by critic
     - Maximum revisions reached (prevents infinite loops)
     """
-    if state.get("is_approved", False):
+    if state["is_approved"]:
         print(f"[Router] Work approved after {state['revision_count']} revision(s) -> Finalize")
         return "finalize"
     
-    if state.get("revision_count", 0) >= state.get("max_revisions", 3):
+    if state["revision_count"] >= state["max_revisions"]:
         print(f"[Router] Max revisions reached -> Finalize (best effort)")
         return "finalize"
     
@@ -192,39 +254,71 @@ app = workflow.compile()
 # RUN
 # =============================================================================
 
-if __name__ == "__main__":
-    # Test with a writing task that benefits from iteration
-    task = """
-    Write a product announcement email for our new AI-powered code review tool.
-    
-    Key features:
-    - Catches bugs before they reach production
-    - Learns your team's coding standards
-    - Integrates with GitHub, GitLab, and Bitbucket
-    - Free tier available for small teams
-    
-    Target audience: Engineering managers at mid-size companies (100-500 employees)
-    
-    Tone: Professional but not stuffy, confident but not arrogant
-    """
-    
-    print("=" * 60)
-    print("TASK")
-    print("=" * 60)
-    print(task)
-    print("=" * 60)
-    
-    result = app.invoke({
+def make_state(task: str) -> CritiqueState:
+    """Builds the initial workflow state for a task."""
+    return {
         "task": task,
         "current_work": "",
         "critique": "",
         "revision_count": 0,
         "max_revisions": 3,
         "is_approved": False,
-        "final_work": ""
-    })
+        "final_work": "",
+        "creator_history": [],
+        "critic_history": []
+    }
+
+
+async def run(initial_state: CritiqueState) -> dict:
+    """Warms up the shared client, then runs the workflow on the same event loop."""
+    await warmup()
+    return await app.ainvoke(initial_state)
+
+
+async def run_many(tasks: list[str]) -> list[dict]:
+    """Runs many tasks through the workflow, BATCH_CONCURRENCY at a time."""
+    await warmup()
+    return await app.abatch([make_state(t) for t in tasks], config={"max_concurrency": BATCH_CONCURRENCY})
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Critique and refine pattern")
+    parser.add_argument("--batch", nargs="+", metavar="TASK", help="run these tasks concurrently instead of the demo")
+    args = parser.parse_args()
     
-    print("\n" + "=" * 60)
-    print(f"FINAL WORK (after {result['revision_count']} revision(s))")
-    print("=" * 60)
-    print(result["final_work"])
\ No newline at end of file
+    if args.batch:
+        results = asyncio.run(run_many(args.batch))
+        for task, result in zip(args.batch, results):
+            print("\n" + "=" * 60)
+            print(f"TASK: {task.strip()[:50]}...")
+            print(f"FINAL WORK (after {result['revision_count']} revision(s))")
+            print("=" * 60)
+            print(result["final_work"])
+    else:
+        # Test with a writing task that benefits from iteration
+        task = """
+        Write a product announcement email for our new AI-powered code review tool.
+        
+        Key features:
+        - Catches bugs before they reach production
+        - Learns your team's coding standards
+        - Integrates with GitHub, GitLab, and Bitbucket
+        - Free tier available for small teams
+        
+        Target audience: Engineering managers at mid-size companies (100-500 employees)
+        
+        Tone: Professional but not stuffy, confident but not arrogant
+        """
+        
+        print("=" * 60)
+        print("TASK")
+        print("=" * 60)
+        print(task)
+        print("=" * 60)
+        
+        result = asyncio.run(run(make_state(task)))
+        
+        print("\n" + "=" * 60)
+        print(f"FINAL WORK (after {result['revision_count']} revision(s))")
+        print("=" * 60)
+        print(result["final_work"])
\ No newline at end of file
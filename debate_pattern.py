@@ -7,14 +7,14 @@
 
 from typing import TypedDict, Annotated, Literal
 from langgraph.graph import StateGraph, START, END
-from langchain_openai import ChatOpenAI
-from dotenv import load_dotenv
+from langchain_core.messages import AIMessage, BaseMessage
+from langchain_core.prompts import ChatPromptTemplate
+from langchain_core.runnables import RunnableConfig
+from llm_client import ainvoke_limited, astream_limited, warmup, BATCH_CONCURRENCY
+import argparse
+import asyncio
 import operator
 
-load_dotenv()
-
-llm = ChatOpenAI(model="gpt-4o-mini", temperature=0.7)
-
 
 # =============================================================================
 # STATE
@@ -22,8 +22,10 @@ llm = ChatOpenAI(model="gpt-4o-mini", temperature=0.7)
 
 class DebateState(TypedDict):
     topic: str                                              # The debate topic
-    pro_arguments: Annotated[list[str], operator.add]       # Arguments in favor
-    con_arguments: Annotated[list[str], operator.add]       # Arguments against
+    pro_argument: str                                       # Latest argument in favor
+    con_argument: str                                       # Latest argument against
+    pro_history: Annotated[list[BaseMessage], operator.add] # Pro debater's chat thread
+    con_history: Annotated[list[BaseMessage], operator.add] # Con debater's chat thread
     current_round: int                                      # Current debate round
     max_rounds: int                                         # Maximum rounds
     synthesis: str                                          # Judge's final synthesis
@@ -31,60 +33,115 @@ class DebateState(TypedDict):
 
 # =============================================================================
 # DEBATERS
+# Each side keeps its own chat thread that grows by one turn per round.
+# The stable prefix (system prompt + earlier rounds) is resent unchanged,
+# so the provider's prompt cache only has to prefill the newest turn.
 # =============================================================================
 
-def pro_debater(state: DebateState) -> dict:
+PRO_SYSTEM = ChatPromptTemplate.from_messages([("system", """You are arguing IN FAVOR of: {topic}
+
+Each round, provide ONE compelling argument. Be concise (2-3 paragraphs) but persuasive.
+Use evidence and logic, not just assertions.""")])
+
+PRO_OPENING = ChatPromptTemplate.from_template("""Round {round_num} of {max_rounds}.
+
+You are opening the debate. Make your strongest opening argument.""")
+
+PRO_REBUTTAL = ChatPromptTemplate.from_template("""Round {round_num} of {max_rounds}.
+
+The opposition has argued: {con_argument}
+
+Respond to their points while advancing your position.""")
+
+CON_SYSTEM = ChatPromptTemplate.from_messages([("system", """You are arguing AGAINST: {topic}
+
+Each round, provide ONE compelling counter-argument. Be concise (2-3 paragraphs) but persuasive.
+Use evidence and logic, not just assertions.""")])
+
+CON_OPENING = ChatPromptTemplate.from_template("""Round {round_num} of {max_rounds}.
+
+You are opening the case against. Make your strongest opening argument.""")
+
+CON_REBUTTAL = ChatPromptTemplate.from_template("""Round {round_num} of {max_rounds}.
+
+The proponent has argued: {pro_argument}
+
+Counter their argument while advancing your position. Find weaknesses in their reasoning.""")
+
+
+async def pro_debater(state: DebateState) -> dict:
     """
     Argues in favor of the topic.
     
     Responds to opposing arguments to create genuine intellectual exchange,
     not just isolated talking points.
     """
-    round_num = state.get("current_round", 1)
-    existing_con = state.get("con_arguments", [])
+    round_num = state["current_round"]
+    con_argument = state["con_argument"]
+    history = state["pro_history"]
     
-    if existing_con:
-        context = f"The opposition has argued: {existing_con[-1]}\n\nRespond to their points while advancing your position."
-    else:
-        context = "You are opening the debate. Make your strongest opening argument."
+    new_messages = []
+    if not history:
+        new_messages += PRO_SYSTEM.format_messages(topic=state["topic"])
     
-    prompt = f"""You are arguing IN FAVOR of: {state['topic']}
-
-Round {round_num} of {state.get('max_rounds', 3)}.
-
-{context}
-
-Provide ONE compelling argument. Be concise (2-3 paragraphs) but persuasive.
-Use evidence and logic, not just assertions."""
+    if con_argument:
+        new_messages += PRO_REBUTTAL.format_messages(
+            round_num=round_num,
+            max_rounds=state["max_rounds"],
+            con_argument=con_argument
+        )
+    else:
+        new_messages += PRO_OPENING.format_messages(round_num=round_num, max_rounds=state["max_rounds"])
     
-    response = llm.invoke(prompt)
+    response = await ainvoke_limited(history + new_messages)
     print(f"[Pro] Round {round_num} argument delivered")
-    return {"pro_arguments": [f"[Round {round_num}] {response.content}"]}
+    return {
+        "pro_argument": response.content,
+        "pro_history": new_messages + [response]
+    }
 
 
-def con_debater(state: DebateState) -> dict:
+async def con_debater(state: DebateState) -> dict:
     """
     Argues against the topic.
     
     Must engage with the pro arguments, not just present independent points.
     """
-    round_num = state.get("current_round", 1)
-    existing_pro = state.get("pro_arguments", [])
+    round_num = state["current_round"]
+    pro_argument = state["pro_argument"]
+    history = state["con_history"]
     
-    prompt = f"""You are arguing AGAINST: {state['topic']}
-
-Round {round_num} of {state.get('max_rounds', 3)}.
-
-The proponent has argued: {existing_pro[-1] if existing_pro else 'Nothing yet'}
+    new_messages = []
+    if not history:
+        new_messages += CON_SYSTEM.format_messages(topic=state["topic"])
+    
+    if pro_argument:
+        new_messages += CON_REBUTTAL.format_messages(
+            round_num=round_num,
+            max_rounds=state["max_rounds"],
+            pro_argument=pro_argument
+        )
+    else:
+        new_messages += CON_OPENING.format_messages(round_num=round_num, max_rounds=state["max_rounds"])
+    
+    response = await ainvoke_limited(history + new_messages)
+    print(f"[Con] Round {round_num} argument delivered")
+    return {
+        "con_argument": response.content,
+        "con_history": new_messages + [response]
+    }
 
-Counter their argument while advancing your position. Find weaknesses in their reasoning.
 
-Provide ONE compelling counter-argument. Be concise (2-3 paragraphs) but persuasive.
-Use evidence and logic, not just assertions."""
+async def debate_round(state: DebateState) -> dict:
+    """
+    Runs both sides of a round concurrently.
     
-    response = llm.invoke(prompt)
-    print(f"[Con] Round {round_num} argument delivered")
-    return {"con_arguments": [f"[Round {round_num}] {response.content}"]}
+    Both sides open independently, and in every later round each debater
+    responds to the other side's previous-round argument, so neither has
+    to wait for the other and no argument is answered twice.
+    """
+    pro, con = await asyncio.gather(pro_debater(state), con_debater(state))
+    return {**pro, **con}
 
 
 # =============================================================================
@@ -93,14 +150,13 @@ Use evidence and logic, not just assertions."""
 
 def round_coordinator(state: DebateState) -> dict:
     """Advances the round counter."""
-    current = state.get("current_round", 1)
-    return {"current_round": current + 1}
+    return {"current_round": state["current_round"] + 1}
 
 
 def should_continue(state: DebateState) -> Literal["continue", "judge"]:
     """Decides whether to continue debating or move to judgment."""
-    current_round = state.get("current_round", 1)
-    max_rounds = state.get("max_rounds", 3)
+    current_round = state["current_round"]
+    max_rounds = state["max_rounds"]
     
     if current_round >= max_rounds:
         print(f"[Coordinator] Debate complete after {current_round} rounds -> Judge")
@@ -114,19 +170,9 @@ def should_continue(state: DebateState) -> Literal["continue", "judge"]:
 # JUDGE
 # =============================================================================
 
-def judge(state: DebateState) -> dict:
-    """
-    Synthesizes the debate into a balanced conclusion.
-    
-    The judge is impartial - they identify the strongest points from
-    each side and provide a nuanced conclusion.
-    """
-    pro_args = "\n\n".join(state["pro_arguments"])
-    con_args = "\n\n".join(state["con_arguments"])
-    
-    prompt = f"""As an impartial judge, synthesize this debate:
+JUDGE_PROMPT = ChatPromptTemplate.from_template("""As an impartial judge, synthesize this debate:
 
-TOPIC: {state['topic']}
+TOPIC: {topic}
 
 ARGUMENTS IN FAVOR:
 {pro_args}
@@ -141,11 +187,41 @@ Provide:
 4. A balanced conclusion that acknowledges the complexity
 5. What additional information would help resolve this debate
 
-Be fair to both sides. Avoid false balance - if one side genuinely has stronger arguments, say so."""
+Be fair to both sides. Avoid false balance - if one side genuinely has stronger arguments, say so.""")
+
+
+def transcript(history: list[BaseMessage]) -> str:
+    """
+    Rebuilds one side's arguments from its chat thread.
+    
+    The state only carries each side's latest argument, so the full
+    transcript is produced here, once, when the judge needs it.
+    """
+    replies = (m.content for m in history if isinstance(m, AIMessage))
+    return "\n\n".join(f"[Round {n}] {content}" for n, content in enumerate(replies, 1))
+
+
+async def judge(state: DebateState, config: RunnableConfig) -> dict:
+    """
+    Synthesizes the debate into a balanced conclusion.
+    
+    The judge is impartial - they identify the strongest points from
+    each side and provide a nuanced conclusion. The synthesis streams
+    to stdout unless the run is part of a batch.
+    """
+    prompt = JUDGE_PROMPT.format_messages(
+        topic=state["topic"],
+        pro_args=transcript(state["pro_history"]),
+        con_args=transcript(state["con_history"])
+    )
     
-    response = llm.invoke(prompt)
+    if config["configurable"].get("stream_output", True):
+        print(f"\n{'=' * 60}\nJUDGE'S SYNTHESIS\n{'=' * 60}")
+        synthesis = await astream_limited(prompt)
+    else:
+        synthesis = (await ainvoke_limited(prompt)).content
     print("[Judge] Synthesis complete")
-    return {"synthesis": response.content}
+    return {"synthesis": synthesis}
 
 
 # =============================================================================
@@ -155,22 +231,20 @@ Be fair to both sides. Avoid false balance - if one side genuinely has stronger
 workflow = StateGraph(DebateState)
 
 # Add nodes
-workflow.add_node("pro", pro_debater)
-workflow.add_node("con", con_debater)
+workflow.add_node("round", debate_round)
 workflow.add_node("coordinator", round_coordinator)
 workflow.add_node("judge", judge)
 
-# Debate flow: pro argues, con responds, coordinator checks if we continue
-workflow.add_edge(START, "pro")
-workflow.add_edge("pro", "con")
-workflow.add_edge("con", "coordinator")
+# Each round runs both sides at once, then the coordinator checks if we continue
+workflow.add_edge(START, "round")
+workflow.add_edge("round", "coordinator")
 
-# Either continue to next round or move to judge
+# Either run the next round or move to judge
 workflow.add_conditional_edges(
     "coordinator",
     should_continue,
     {
-        "continue": "pro",
+        "continue": "round",
         "judge": "judge"
     }
 )
@@ -184,24 +258,58 @@ app = workflow.compile()
 # RUN
 # =============================================================================
 
-if __name__ == "__main__":
-    # Test with a debatable topic
-    topic = "Remote work should be the default for knowledge workers"
-    
-    print("=" * 60)
-    print(f"DEBATE TOPIC: {topic}")
-    print("=" * 60)
-    
-    result = app.invoke({
+def make_state(topic: str, max_rounds: int = 2) -> DebateState:
+    """Builds the initial workflow state for a topic."""
+    return {
         "topic": topic,
-        "pro_arguments": [],
-        "con_arguments": [],
+        "pro_argument": "",
+        "con_argument": "",
+        "pro_history": [],
+        "con_history": [],
         "current_round": 1,
-        "max_rounds": 2,
+        "max_rounds": max_rounds,
         "synthesis": ""
-    })
+    }
+
+
+async def run(initial_state: DebateState) -> dict:
+    """Warms up the shared client, then runs the workflow on the same event loop."""
+    await warmup()
+    return await app.ainvoke(initial_state)
+
+
+async def run_many(topics: list[str]) -> list[dict]:
+    """
+    Runs many topics through the workflow, BATCH_CONCURRENCY at a time.
+    
+    Streaming is turned off so concurrent syntheses don't interleave on stdout.
+    """
+    await warmup()
+    return await app.abatch(
+        [make_state(t) for t in topics],
+        config={"max_concurrency": BATCH_CONCURRENCY, "configurable": {"stream_output": False}}
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Debate pattern")
+    parser.add_argument("--batch", nargs="+", metavar="TOPIC", help="debate these topics concurrently instead of the demo")
+    args = parser.parse_args()
     
-    print("\n" + "=" * 60)
-    print("JUDGE'S SYNTHESIS")
-    print("=" * 60)
-    print(result["synthesis"])
\ No newline at end of file
+    if args.batch:
+        results = asyncio.run(run_many(args.batch))
+        for topic, result in zip(args.batch, results):
+            print("\n" + "=" * 60)
+            print(f"DEBATE TOPIC: {topic}")
+            print("=" * 60)
+            print(result["synthesis"])
+    else:
+        # Test with a debatable topic
+        topic = "Remote work should be the default for knowledge workers"
+        
+        print("=" * 60)
+        print(f"DEBATE TOPIC: {topic}")
+        print("=" * 60)
+        
+        # The synthesis streams to stdout as it is generated
+        asyncio.run(run(make_state(topic)))
\ No newline at end of file
@@ -7,12 +7,15 @@
 
 from typing import TypedDict
 from langgraph.graph import StateGraph, START, END
-from langchain_openai import ChatOpenAI
-from dotenv import load_dotenv
-
-load_dotenv()
-
-llm = ChatOpenAI(model="gpt-4o-mini", temperature=0.7)
+from langchain_core.messages import BaseMessage
+from langchain_core.prompts import ChatPromptTemplate
+from langchain_core.runnables import RunnableConfig
+from llm_client import ping_llm, ainvoke_limited, astream_limited, warmup, BATCH_CONCURRENCY
+import argparse
+import asyncio
+import hashlib
+import httpx
+import openai
 
 
 # =============================================================================
@@ -24,6 +27,7 @@ class EnsembleState(TypedDict):
     solution_creative: str      # Creative solver's approach
     solution_analytical: str    # Analytical solver's approach
     solution_practical: str     # Practical solver's approach
+    solution_order: list[str]   # Solution keys in the order the solvers finished
     merged_solution: str        # Final synthesized solution
 
 
@@ -33,16 +37,30 @@ class EnsembleState(TypedDict):
 # They run in parallel and are unaware of each other's solutions.
 # =============================================================================
 
-def creative_solver(state: EnsembleState) -> dict:
-    """
-    Thinks outside the box.
+# In-flight solver calls, keyed by solver and prompt hash. When the same
+# problem is submitted again while a call is still running, the new caller
+# awaits the existing call instead of paying for another one.
+_inflight: dict[str, asyncio.Task] = {}
+
+
+async def coalesced_ainvoke(solver: str, prompt: list[BaseMessage]) -> BaseMessage:
+    """Invokes the model, sharing one call among concurrent identical requests."""
+    digest = hashlib.sha256("\n".join(m.content for m in prompt).encode()).hexdigest()
+    key = f"{solver}:{digest}"
     
-    Prioritizes novel, unconventional ideas over safe solutions.
-    May suggest things that seem impractical but spark insight.
-    """
-    prompt = f"""Solve this problem CREATIVELY. Think outside the box.
+    task = _inflight.get(key)
+    if task is None:
+        task = asyncio.create_task(ainvoke_limited(prompt))
+        _inflight[key] = task
+        task.add_done_callback(lambda _: _inflight.pop(key, None))
+    
+    # Shielded so one caller being cancelled doesn't cancel the shared call
+    return await asyncio.shield(task)
+
+
+CREATIVE_PROMPT = ChatPromptTemplate.from_template("""Solve this problem CREATIVELY. Think outside the box.
 
-PROBLEM: {state['problem']}
+PROBLEM: {problem}
 
 Your approach should:
 - Challenge conventional assumptions
@@ -50,23 +68,26 @@ Your approach should:
 - Prioritize innovation over safety
 - Use analogies from unexpected domains
 
-Be bold. The practical constraints will be handled by others."""
-    
-    response = llm.invoke(prompt)
-    print("[Creative Solver] Solution ready")
-    return {"solution_creative": response.content}
+Be bold. The practical constraints will be handled by others.""")
 
 
-def analytical_solver(state: EnsembleState) -> dict:
+async def creative_solver(state: EnsembleState) -> dict:
     """
-    Uses data and logic.
+    Thinks outside the box.
     
-    Breaks down the problem systematically, considers trade-offs,
-    and provides clear reasoning for recommendations.
+    Prioritizes novel, unconventional ideas over safe solutions.
+    May suggest things that seem impractical but spark insight.
     """
-    prompt = f"""Solve this problem ANALYTICALLY. Use logic and structure.
+    prompt = CREATIVE_PROMPT.format_messages(problem=state["problem"])
+    
+    response = await coalesced_ainvoke("creative", prompt)
+    print("[Creative Solver] Solution ready")
+    return {"solution_creative": response.content}
+
+
+ANALYTICAL_PROMPT = ChatPromptTemplate.from_template("""Solve this problem ANALYTICALLY. Use logic and structure.
 
-PROBLEM: {state['problem']}
+PROBLEM: {problem}
 
 Your approach should:
 - Break the problem into components
@@ -75,23 +96,26 @@ Your approach should:
 - Provide clear reasoning for each recommendation
 - Acknowledge uncertainties and assumptions
 
-Be rigorous. Show your work."""
-    
-    response = llm.invoke(prompt)
-    print("[Analytical Solver] Solution ready")
-    return {"solution_analytical": response.content}
+Be rigorous. Show your work.""")
 
 
-def practical_solver(state: EnsembleState) -> dict:
+async def analytical_solver(state: EnsembleState) -> dict:
     """
-    Focuses on what's actionable.
+    Uses data and logic.
     
-    Prioritizes implementability, quick wins, and realistic constraints.
-    Less interested in elegance, more interested in getting things done.
+    Breaks down the problem systematically, considers trade-offs,
+    and provides clear reasoning for recommendations.
     """
-    prompt = f"""Solve this problem PRACTICALLY. Focus on what's actionable.
+    prompt = ANALYTICAL_PROMPT.format_messages(problem=state["problem"])
+    
+    response = await coalesced_ainvoke("analytical", prompt)
+    print("[Analytical Solver] Solution ready")
+    return {"solution_analytical": response.content}
+
+
+PRACTICAL_PROMPT = ChatPromptTemplate.from_template("""Solve this problem PRACTICALLY. Focus on what's actionable.
 
-PROBLEM: {state['problem']}
+PROBLEM: {problem}
 
 Your approach should:
 - Prioritize solutions that can be implemented quickly
@@ -100,38 +124,94 @@ Your approach should:
 - Break recommendations into concrete next steps
 - Anticipate implementation challenges
 
-Be realistic. Perfect is the enemy of good."""
+Be realistic. Perfect is the enemy of good.""")
+
+
+async def practical_solver(state: EnsembleState) -> dict:
+    """
+    Focuses on what's actionable.
+    
+    Prioritizes implementability, quick wins, and realistic constraints.
+    Less interested in elegance, more interested in getting things done.
+    """
+    prompt = PRACTICAL_PROMPT.format_messages(problem=state["problem"])
     
-    response = llm.invoke(prompt)
+    response = await coalesced_ainvoke("practical", prompt)
     print("[Practical Solver] Solution ready")
     return {"solution_practical": response.content}
 
 
-# =============================================================================
-# MERGER
-# =============================================================================
+# Priming requests still in flight. The event loop only keeps weak
+# references to tasks, so this holds them until they finish.
+_priming: set[asyncio.Task] = set()
 
-def solution_merger(state: EnsembleState) -> dict:
+
+async def prime_merger(problem: str, solutions: list[tuple[str, str]]) -> None:
+    """Sends the merger's prompt prefix as a one-token request so the provider caches its prefill."""
+    try:
+        await ainvoke_limited(merger_prefix(problem, solutions), ping_llm)
+    except (httpx.HTTPError, openai.OpenAIError):
+        # Priming is best effort - the merger works the same without it
+        pass
+
+
+async def run_solvers(state: EnsembleState) -> dict:
     """
-    Synthesizes all three approaches into one coherent solution.
+    Runs all three solvers concurrently.
     
-    The merger's job is to find the best insights from each approach
-    and combine them into something better than any individual solution.
+    The solvers share no data, so their LLM calls are awaited together
+    and the stage takes as long as the slowest solver, not the sum of all three.
+    
+    As soon as two solutions are in, the merger's prompt prefix (problem plus
+    those two solutions) is sent as a one-token request while the slowest
+    solver finishes. The provider caches that prefill, so the real merger
+    call only has to prefill the last solution and its instructions. The
+    merger never waits on the priming request.
     """
-    prompt = f"""You have three different approaches to this problem:
+    solutions = []  # (state key, solution) in completion order
+    prime = None
+    
+    try:
+        for next_done in asyncio.as_completed([
+            creative_solver(state),
+            analytical_solver(state),
+            practical_solver(state)
+        ]):
+            solutions += (await next_done).items()
+            if len(solutions) == 2:
+                prime = asyncio.create_task(prime_merger(state["problem"], list(solutions)))
+                _priming.add(prime)
+                prime.add_done_callback(_priming.discard)
+    except BaseException:
+        # No merger will follow, so the primed prefix is of no use
+        if prime is not None:
+            prime.cancel()
+        raise
+    
+    return {**dict(solutions), "solution_order": [key for key, _ in solutions]}
 
-PROBLEM: {state['problem']}
 
-CREATIVE APPROACH:
-{state['solution_creative']}
+# =============================================================================
+# MERGER
+# The prompt is built as separate messages, one per solution, in the order
+# the solvers finished. That keeps it an exact extension of the prefix
+# primed by run_solvers.
+# =============================================================================
 
-ANALYTICAL APPROACH:
-{state['solution_analytical']}
+SOLUTION_LABELS = {
+    "solution_creative": "CREATIVE APPROACH",
+    "solution_analytical": "ANALYTICAL APPROACH",
+    "solution_practical": "PRACTICAL APPROACH"
+}
 
-PRACTICAL APPROACH:
-{state['solution_practical']}
+MERGER_INTRO = ChatPromptTemplate.from_template("""You have three different approaches to this problem:
 
-Synthesize these into ONE comprehensive solution that:
+PROBLEM: {problem}""")
+
+MERGER_SOLUTION = ChatPromptTemplate.from_template("""{label}:
+{solution}""")
+
+MERGER_INSTRUCTIONS = ChatPromptTemplate.from_template("""Synthesize these into ONE comprehensive solution that:
 1. Takes the most innovative insights from the creative approach
 2. Incorporates the rigorous analysis and trade-off thinking from the analytical approach
 3. Grounds everything in the actionable, realistic framing of the practical approach
@@ -141,11 +221,35 @@ Don't just summarize each approach. Create something new that's better than any
 Structure your response as:
 - RECOMMENDED APPROACH: The synthesized solution
 - KEY INSIGHTS COMBINED: What each perspective contributed
-- IMPLEMENTATION PRIORITY: What to do first, second, third"""
+- IMPLEMENTATION PRIORITY: What to do first, second, third""")
+
+
+def merger_prefix(problem: str, solutions: list[tuple[str, str]]) -> list[BaseMessage]:
+    """Builds the merger's messages for the problem and the given solutions."""
+    messages = MERGER_INTRO.format_messages(problem=problem)
+    for key, solution in solutions:
+        messages += MERGER_SOLUTION.format_messages(label=SOLUTION_LABELS[key], solution=solution)
+    return messages
+
+
+async def solution_merger(state: EnsembleState, config: RunnableConfig) -> dict:
+    """
+    Synthesizes all three approaches into one coherent solution.
     
-    response = llm.invoke(prompt)
+    The merger's job is to find the best insights from each approach
+    and combine them into something better than any individual solution.
+    The synthesis streams to stdout unless the run is part of a batch.
+    """
+    solutions = [(key, state[key]) for key in state["solution_order"]]
+    prompt = merger_prefix(state["problem"], solutions) + MERGER_INSTRUCTIONS.format_messages()
+    
+    if config["configurable"].get("stream_output", True):
+        print(f"\n{'=' * 60}\nMERGED SOLUTION\n{'=' * 60}")
+        merged_solution = await astream_limited(prompt)
+    else:
+        merged_solution = (await ainvoke_limited(prompt)).content
     print("[Merger] Synthesis complete")
-    return {"merged_solution": response.content}
+    return {"merged_solution": merged_solution}
 
 
 # =============================================================================
@@ -155,21 +259,13 @@ Structure your response as:
 workflow = StateGraph(EnsembleState)
 
 # Add nodes
-workflow.add_node("creative", creative_solver)
-workflow.add_node("analytical", analytical_solver)
-workflow.add_node("practical", practical_solver)
+workflow.add_node("solvers", run_solvers)
 workflow.add_node("merger", solution_merger)
 
-# All three solvers start in parallel from START
-workflow.add_edge(START, "creative")
-workflow.add_edge(START, "analytical")
-workflow.add_edge(START, "practical")
-
-# All three feed into the merger
-# LangGraph waits for all incoming edges before executing a node
-workflow.add_edge("creative", "merger")
-workflow.add_edge("analytical", "merger")
-workflow.add_edge("practical", "merger")
+# All three solvers run concurrently inside a single node,
+# then their solutions feed into the merger
+workflow.add_edge(START, "solvers")
+workflow.add_edge("solvers", "merger")
 
 workflow.add_edge("merger", END)
 
@@ -180,31 +276,64 @@ app = workflow.compile()
 # RUN
 # =============================================================================
 
-if __name__ == "__main__":
-    # Test with a complex business problem
-    problem = """
-    Our B2B SaaS startup has strong product-market fit (NPS 65, low churn) but 
-    is struggling to scale sales. We have 2 sales reps closing $50k/month each, 
-    but adding more reps hasn't proportionally increased revenue. Our sales cycle 
-    is 45 days and requires significant pre-sales engineering support.
-    
-    How should we scale revenue from $1.2M to $5M ARR in the next 18 months?
-    """
-    
-    print("=" * 60)
-    print("PROBLEM")
-    print("=" * 60)
-    print(problem)
-    
-    result = app.invoke({
+def make_state(problem: str) -> EnsembleState:
+    """Builds the initial workflow state for a problem."""
+    return {
         "problem": problem,
         "solution_creative": "",
         "solution_analytical": "",
         "solution_practical": "",
+        "solution_order": [],
         "merged_solution": ""
-    })
+    }
+
+
+async def run(initial_state: EnsembleState) -> dict:
+    """Warms up the shared client, then runs the workflow on the same event loop."""
+    await warmup()
+    return await app.ainvoke(initial_state)
+
+
+async def run_many(problems: list[str]) -> list[dict]:
+    """
+    Runs many problems through the workflow, BATCH_CONCURRENCY at a time.
+    
+    Streaming is turned off so concurrent merges don't interleave on stdout.
+    """
+    await warmup()
+    return await app.abatch(
+        [make_state(p) for p in problems],
+        config={"max_concurrency": BATCH_CONCURRENCY, "configurable": {"stream_output": False}}
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Ensemble pattern")
+    parser.add_argument("--batch", nargs="+", metavar="PROBLEM", help="solve these problems concurrently instead of the demo")
+    args = parser.parse_args()
     
-    print("\n" + "=" * 60)
-    print("MERGED SOLUTION")
-    print("=" * 60)
-    print(result["merged_solution"])
\ No newline at end of file
+    if args.batch:
+        results = asyncio.run(run_many(args.batch))
+        for problem, result in zip(args.batch, results):
+            print("\n" + "=" * 60)
+            print(f"PROBLEM: {problem.strip()[:50]}...")
+            print("=" * 60)
+            print(result["merged_solution"])
+    else:
+        # Test with a complex business problem
+        problem = """
+        Our B2B SaaS startup has strong product-market fit (NPS 65, low churn) but 
+        is struggling to scale sales. We have 2 sales reps closing $50k/month each, 
+        but adding more reps hasn't proportionally increased revenue. Our sales cycle 
+        is 45 days and requires significant pre-sales engineering support.
+        
+        How should we scale revenue from $1.2M to $5M ARR in the next 18 months?
+        """
+        
+        print("=" * 60)
+        print("PROBLEM")
+        print("=" * 60)
+        print(problem)
+        
+        # The merged solution streams to stdout as it is generated
+        asyncio.run(run(make_state(problem)))
\ No newline at end of file
@@ -0,0 +1,113 @@
+# Shared LLM Client
+#
+# A single chat model used by all four patterns. Every module imports `llm`
+# from here, so they all share one HTTP connection pool instead of each
+# building its own client and paying a fresh TLS handshake per connection.
+
+import httpx
+import openai
+from aiolimiter import AsyncLimiter
+from langchain_core.language_models import LanguageModelInput
+from langchain_core.runnables import Runnable
+from langchain_openai import ChatOpenAI
+from dotenv import load_dotenv
+import asyncio
+import os
+import sys
+
+# Load .env once for all patterns. Skipped when the key is already in the
+# environment (e.g. injected in production), so .env is never read from disk.
+if not os.getenv("OPENAI_API_KEY"):
+    load_dotenv()
+
+
+# =============================================================================
+# HTTP CLIENT
+# Pool limits are raised well above httpx's defaults so the parallel parts
+# of the patterns (ensemble solvers, batched requests) never queue on a
+# free connection. HTTP/2 multiplexes concurrent calls over one connection.
+# =============================================================================
+
+MAX_CONNECTIONS = 2000
+
+_http = httpx.AsyncClient(
+    limits=httpx.Limits(max_connections=MAX_CONNECTIONS, max_keepalive_connections=1500),
+    timeout=httpx.Timeout(120.0),
+    http2=True
+)
+
+llm = ChatOpenAI(model="gpt-4o-mini", temperature=0.7, http_async_client=_http)
+
+
+# =============================================================================
+# RATE LIMITING
+# Parallel nodes and batched runs can burst past the account's rate limit,
+# and the resulting 429 retries cost more than they save. Every call goes
+# through a concurrency cap and a requests-per-minute token bucket, both
+# sized via env vars to match the account's tier.
+# =============================================================================
+
+RPM = int(os.getenv("LLM_RPM", "500"))
+CONCURRENCY = int(os.getenv("LLM_CONCURRENCY", str(MAX_CONNECTIONS - 50)))
+
+# How many workflow runs `app.abatch` schedules at once in the batch modes
+BATCH_CONCURRENCY = 32
+
+_rpm = AsyncLimiter(max_rate=RPM, time_period=60)
+_sem = asyncio.Semaphore(CONCURRENCY)
+
+
+async def ainvoke_limited(prompt: LanguageModelInput, model: Runnable = llm):
+    """Invokes the model (or a bound/structured variant of it) within the rate limits."""
+    async with _sem, _rpm:
+        return await model.ainvoke(prompt)
+
+
+async def astream_limited(prompt: LanguageModelInput, model: Runnable = llm) -> str:
+    """
+    Streams the model's reply to stdout as it arrives and returns the full text.
+    
+    Used for long-form terminal outputs, so the reader sees the first tokens
+    instead of waiting for the whole completion.
+    """
+    chunks = []
+    async with _sem, _rpm:
+        async for chunk in model.astream(prompt):
+            sys.stdout.write(chunk.content)
+            sys.stdout.flush()
+            chunks.append(chunk.content)
+    sys.stdout.write("\n")
+    return "".join(chunks)
+
+
+# =============================================================================
+# WARMUP
+# =============================================================================
+
+# One output token, never cached - for requests whose only job is to warm
+# the model route or prefill a prompt prefix
+ping_llm = llm.model_copy(update={"max_tokens": 1, "cache": False})
+
+_warmed = False
+
+
+async def warmup() -> None:
+    """
+    Pre-establishes the TLS connection and warms the model route with a
+    one-token completion, so the first real call doesn't pay for either.
+    
+    Runs once per process; later calls return immediately. Must be awaited
+    on the same event loop that runs the workflow, since pooled connections
+    are bound to the loop that opened them.
+    """
+    global _warmed
+    if _warmed:
+        return
+    _warmed = True
+    
+    try:
+        await _http.head("https://api.openai.com/v1/models")
+        await ainvoke_limited("ping", ping_llm)
+    except (httpx.HTTPError, openai.OpenAIError):
+        # Warmup is best effort - the first real call will connect anyway
+        pass
\ No newline at end of file
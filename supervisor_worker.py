@@ -1,17 +1,17 @@
 # Supervisor-Worker Pattern
 # Full code for: https://medium.com/@v31u/stop-overloading-your-ai-agent-build-a-team-instead-256fb0097eb7
 #
-# A supervisor agent analyzes requests, delegates to specialist workers,
-# and synthesizes results. This mirrors how human organizations work.
+# A single supervisor call classifies the request, writes the answer in the
+# matching specialist's style, and polishes it - one LLM round trip per
+# request instead of one per role.
 
 from typing import TypedDict, Literal
 from langgraph.graph import StateGraph, START, END
-from langchain_openai import ChatOpenAI
-from dotenv import load_dotenv
-
-load_dotenv()
-
-llm = ChatOpenAI(model="gpt-4o-mini", temperature=0.7)
+from langchain_core.prompts import ChatPromptTemplate
+from pydantic import BaseModel, Field
+from llm_client import llm, ainvoke_limited, warmup, BATCH_CONCURRENCY
+import argparse
+import asyncio
 
 
 # =============================================================================
@@ -21,131 +21,75 @@ llm = ChatOpenAI(model="gpt-4o-mini", temperature=0.7)
 class WritingState(TypedDict):
     request: str          # User's writing request
     task_type: str        # Category determined by supervisor
-    draft: str            # Output from specialist worker
     final_output: str     # Polished final output
 
 
 # =============================================================================
 # SUPERVISOR
+# Routing, writing and polishing happen in one structured-output call. The
+# model picks the category and writes the final text using that specialist's
+# instructions, instead of separate calls to classify, draft and polish.
 # =============================================================================
 
-def supervisor(state: WritingState) -> dict:
-    """
-    Analyzes the request and decides which specialist should handle it.
-    
-    The supervisor is an LLM too - it uses reasoning to make routing
-    decisions, not hardcoded rules. This makes the system adaptive.
-    """
-    prompt = f"""Analyze this writing request and categorize it:
+class Routed(BaseModel):
+    """The supervisor's routing decision and the specialist's final output."""
+    task_type: Literal["email", "blog", "summary"] = Field(description="Category of the writing request")
+    output: str = Field(description="Polished text written using the instructions for the chosen category")
+
 
-Request: {state['request']}
+routed_llm = llm.with_structured_output(Routed)
+
+SUPERVISOR_PROMPT = ChatPromptTemplate.from_template("""Analyze this writing request, categorize it, and write it:
+
+Request: {request}
 
 Categories:
 - email: Professional correspondence, formal messages, business communication
 - blog: Articles, posts, educational content, thought pieces
 - summary: Condensing information, briefs, executive summaries
 
-Reply with just the category name (email, blog, or summary)."""
-    
-    response = llm.invoke(prompt)
-    task_type = response.content.strip().lower()
-    
-    # Normalize the response to handle variations
-    if "email" in task_type:
-        task_type = "email"
-    elif "blog" in task_type:
-        task_type = "blog"
-    else:
-        task_type = "summary"
-    
-    print(f"[Supervisor] Routing to: {task_type}")
-    return {"task_type": task_type}
-
+Choose the category that fits best, then write it.
+Use the section matching the category you choose:
 
-# =============================================================================
-# SPECIALIST WORKERS
-# =============================================================================
-
-def email_writer(state: WritingState) -> dict:
-    """Specialist for professional emails."""
-    prompt = f"""Write a professional email for this request:
-
-{state['request']}
-
-Use proper email format with:
+EMAIL - Write a professional email. Use proper email format with:
 - Clear subject line
 - Professional greeting
 - Concise body paragraphs
-- Appropriate sign-off"""
-    
-    response = llm.invoke(prompt)
-    print("[Email Writer] Draft complete")
-    return {"draft": response.content}
-
-
-def blog_writer(state: WritingState) -> dict:
-    """Specialist for blog content."""
-    prompt = f"""Write an engaging blog post for this request:
+- Appropriate sign-off
 
-{state['request']}
-
-Include:
+BLOG - Write an engaging blog post. Include:
 - Attention-grabbing headline
 - Hook in the opening paragraph
 - Clear sections with subheadings
 - Actionable takeaways
-- Conversational but authoritative tone"""
-    
-    response = llm.invoke(prompt)
-    print("[Blog Writer] Draft complete")
-    return {"draft": response.content}
-
-
-def summary_writer(state: WritingState) -> dict:
-    """Specialist for summaries and briefs."""
-    prompt = f"""Write a clear, concise summary for this request:
+- Conversational but authoritative tone
 
-{state['request']}
-
-Guidelines:
+SUMMARY - Write a clear, concise summary. Guidelines:
 - Lead with the most important information
 - Use bullet points for key facts
 - Keep it scannable
-- No fluff or filler"""
-    
-    response = llm.invoke(prompt)
-    print("[Summary Writer] Draft complete")
-    return {"draft": response.content}
-
+- No fluff or filler
 
-# =============================================================================
-# FINALIZER
-# =============================================================================
-
-def finalizer(state: WritingState) -> dict:
-    """Polishes the draft into final output."""
-    prompt = f"""Review and polish this draft. Fix any issues with:
+Produce the final polished version directly. Before returning, fix any issues with:
 - Grammar and spelling
 - Clarity and flow
-- Tone consistency
+- Tone consistency""")
 
-Draft:
-{state['draft']}
 
-Return the polished version."""
+async def supervisor(state: WritingState) -> dict:
+    """
+    Analyzes the request, decides which specialist should handle it,
+    and writes the polished output as that specialist.
     
-    response = llm.invoke(prompt)
-    print("[Finalizer] Output polished")
-    return {"final_output": response.content}
-
-
-# =============================================================================
-# ROUTING
-# =============================================================================
-
-def route_to_worker(state: WritingState) -> Literal["email", "blog", "summary"]:
-    """Routes to the appropriate specialist based on supervisor's decision."""
-    return state["task_type"]
+    The supervisor is an LLM too - it uses reasoning to make routing
+    decisions, not hardcoded rules. This makes the system adaptive.
+    """
+    prompt = SUPERVISOR_PROMPT.format_messages(request=state["request"])
+    
+    routed = await ainvoke_limited(prompt, routed_llm)
+    
+    print(f"[Supervisor] Routed to: {routed.task_type}, output complete")
+    return {"task_type": routed.task_type, "final_output": routed.output}
 
 
 # =============================================================================
@@ -156,31 +100,10 @@ workflow = StateGraph(WritingState)
 
 # Add nodes
 workflow.add_node("supervisor", supervisor)
-workflow.add_node("email", email_writer)
-workflow.add_node("blog", blog_writer)
-workflow.add_node("summary", summary_writer)
-workflow.add_node("finalizer", finalizer)
 
-# Supervisor analyzes first
+# Supervisor routes, writes and polishes in one step
 workflow.add_edge(START, "supervisor")
-
-# Route to appropriate specialist
-workflow.add_conditional_edges(
-    "supervisor",
-    route_to_worker,
-    {
-        "email": "email",
-        "blog": "blog",
-        "summary": "summary"
-    }
-)
-
-# All specialists go to finalizer
-workflow.add_edge("email", "finalizer")
-workflow.add_edge("blog", "finalizer")
-workflow.add_edge("summary", "finalizer")
-
-workflow.add_edge("finalizer", END)
+workflow.add_edge("supervisor", END)
 
 app = workflow.compile()
 
@@ -189,7 +112,31 @@ app = workflow.compile()
 # RUN
 # =============================================================================
 
+def make_state(request: str) -> WritingState:
+    """Builds the initial workflow state for a request."""
+    return {
+        "request": request,
+        "task_type": "",
+        "final_output": ""
+    }
+
+
+async def run_many(requests: list[str]) -> list[dict]:
+    """
+    Runs many requests through the workflow, BATCH_CONCURRENCY at a time.
+    
+    The requests are independent, so they are scheduled together on one
+    event loop and share the client's connection pool.
+    """
+    await warmup()
+    return await app.abatch([make_state(r) for r in requests], config={"max_concurrency": BATCH_CONCURRENCY})
+
+
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Supervisor-worker pattern")
+    parser.add_argument("--batch", nargs="+", metavar="REQUEST", help="run these requests instead of the demo requests")
+    args = parser.parse_args()
+    
     # Test with different request types
     test_requests = [
         "Write a message to my team announcing that we're switching to a new project management tool next month",
@@ -197,16 +144,11 @@ if __name__ == "__main__":
         "Condense our Q3 results: revenue up 23%, new customers 145, churn down to 2.1%, launched 3 new features"
     ]
     
-    for request in test_requests:
+    requests = args.batch or test_requests
+    results = asyncio.run(run_many(requests))
+    
+    for request, result in zip(requests, results):
         print("\n" + "=" * 60)
         print(f"REQUEST: {request[:50]}...")
         print("=" * 60)
-        
-        result = app.invoke({
-            "request": request,
-            "task_type": "",
-            "draft": "",
-            "final_output": ""
-        })
-        
         print(f"\nFINAL OUTPUT:\n{result['final_output']}")
\ No newline at end of file